@@ -6,6 +6,7 @@ import logging
 import threading
 import schedule
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import requests
 
@@ -39,6 +40,102 @@ def get_db_connection():
     database_url = os.environ.get('DATABASE_URL')
     return psycopg2.connect(database_url)
 
+# 읽기 전용 복제본(replica) 설정
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+REPLICA_CHECK_INTERVAL = 5   # 복제 지연 재확인 주기(초)
+REPLICA_RETRY_SECONDS = 30   # 복제본 장애 후 재시도까지 대기(초)
+REPLICA_CONNECT_TIMEOUT = 3
+
+_replica_lock = threading.Lock()
+_replica_state = {'checked_at': 0.0, 'healthy': True, 'lag': None, 'error': None}
+_recent_writes = {}  # username -> 마지막 저장 시각 (read-your-writes 보장용)
+
+def mark_recent_write(username):
+    """학생이 저장한 직후 일정 시간 동안 해당 학생 조회는 primary로 보냄"""
+    with _replica_lock:
+        _recent_writes[username] = time.monotonic()
+
+def _is_sticky(username):
+    if not username:
+        return False
+    with _replica_lock:
+        written_at = _recent_writes.get(username)
+        if written_at is None:
+            return False
+        if time.monotonic() - written_at > REPLICA_STICKY_SECONDS:
+            del _recent_writes[username]
+            return False
+        return True
+
+def _get_replica_lag(conn):
+    """복제 지연(초) 확인 - 복제본이 아닌 서버라면 0"""
+    c = conn.cursor()
+    c.execute("""
+        SELECT CASE
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """)
+    lag = float(c.fetchone()[0])
+    c.close()
+    return lag
+
+def _connect_replica():
+    """복제본 연결 시도 - 사용할 수 없으면 None"""
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if not replica_url:
+        return None
+    
+    now = time.monotonic()
+    with _replica_lock:
+        state = dict(_replica_state)
+    
+    # 최근에 장애/지연으로 판정됐다면 재시도 전까지 primary 사용
+    if not state['healthy'] and now - state['checked_at'] < REPLICA_RETRY_SECONDS:
+        return None
+    
+    try:
+        conn = psycopg2.connect(replica_url, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+    except Exception as e:
+        app.logger.warning(f"복제본 연결 실패, primary 사용: {e}")
+        with _replica_lock:
+            _replica_state.update(checked_at=now, healthy=False, error=str(e))
+        return None
+    
+    # 복제 지연은 주기적으로만 확인
+    if now - state['checked_at'] < REPLICA_CHECK_INTERVAL:
+        return conn
+    
+    try:
+        lag = _get_replica_lag(conn)
+    except Exception as e:
+        conn.close()
+        app.logger.warning(f"복제 지연 확인 실패, primary 사용: {e}")
+        with _replica_lock:
+            _replica_state.update(checked_at=now, healthy=False, error=str(e))
+        return None
+    
+    healthy = lag <= REPLICA_MAX_LAG_SECONDS
+    with _replica_lock:
+        _replica_state.update(checked_at=now, healthy=healthy, lag=lag,
+                              error=None if healthy else f"복제 지연 {lag:.1f}초")
+    if not healthy:
+        conn.close()
+        app.logger.warning(f"복제 지연 {lag:.1f}초 > {REPLICA_MAX_LAG_SECONDS}초, primary 사용")
+        return None
+    return conn
+
+def get_read_connection(username=None):
+    """읽기 전용 쿼리용 연결
+    
+    DATABASE_REPLICA_URL이 설정되어 있으면 복제본을 사용하고,
+    복제본 장애/지연 시 또는 username 학생이 방금 저장한 경우 primary를 사용합니다.
+    """
+    if _is_sticky(username):
+        return get_db_connection()
+    return _connect_replica() or get_db_connection()
+
 # 데이터베이스 초기화 함수
 def init_db():
     try:
@@ -114,7 +211,7 @@ def dashboard():
     
     # 선생님 대시보드
     if session['role'] == 'teacher':
-        conn = get_db_connection()
+        conn = get_read_connection()
         c = conn.cursor()
         c.execute("SELECT username FROM users WHERE role='student'")
         students = c.fetchall()
@@ -162,6 +259,7 @@ def dashboard():
             
             conn.commit()
             conn.close()
+            mark_recent_write(session['username'])
             message = "계획이 성공적으로 저장되었습니다! 🎉"
         
         return render_template('student_home.html', username=session['username'], message=message)
@@ -177,7 +275,7 @@ def get_plan():
     if not plan_date:
         return jsonify({'error': 'Date required'}), 400
     
-    conn = get_db_connection()
+    conn = get_read_connection(session['username'])
     c = conn.cursor()
     c.execute("SELECT plan, result, reflection, checklist FROM plans WHERE user_id=%s AND plan_date=%s", 
               (user_id, plan_date))
@@ -213,7 +311,7 @@ def view_student(student_name):
     if 'user_id' not in session or session['role'] != 'teacher':
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
+    conn = get_read_connection(student_name)
     cursor = conn.cursor()
     
     # 학생 정보 가져오기
@@ -316,18 +414,86 @@ def internal_error(error):
 def favicon():
     return '', 204  # No Content
 
-# 선생님 카카오톡 알림 함수
-def send_teacher_kakao_notification(message):
-    """선생님에게 카카오톡 메시지 전송"""
-    
-    # 토큰 확인
-    token = os.environ.get('TEACHER_KAKAO_TOKEN')
-    if not token:
-        app.logger.error("❌ TEACHER_KAKAO_TOKEN이 설정되지 않았습니다")
-        return False
-    
-    url = "https://kapi.kakao.com/v2/api/talk/memo/default/send"
-    
+# 카카오톡 알림 설정
+KAKAO_MEMO_URL = "https://kapi.kakao.com/v2/api/talk/memo/default/send"
+KAKAO_MAX_CONCURRENCY = int(os.environ.get('KAKAO_MAX_CONCURRENCY', 8))
+KAKAO_TIMEOUT = 10  # 요청당 타임아웃(초)
+
+# 알림 메시지 템플릿 (모듈 로드 시 한 번만 만들어 두고 format으로 렌더링)
+NOTIFICATION_TEMPLATES = {
+    'morning_missing': """📋 오전 11시 목표 미작성 알림
+
+⏰ 시간: {current_time}
+📅 날짜: {date}
+
+❌ 목표 미작성 학생들:
+{student_list}
+
+총 {count}명이 아직 오늘의 목표를 작성하지 않았습니다.
+
+👨‍🏫 확인해보세요!""",
+    'morning_done': """✅ 오전 11시 목표 작성 현황
+
+⏰ 시간: {current_time}
+📅 날짜: {date}
+
+🎉 모든 학생이 목표를 작성했습니다!
+훌륭해요! 👏""",
+    'afternoon_missing': """🚨 오후 1시 목표 미작성 재알림
+
+⏰ 시간: {current_time}
+📅 날짜: {date}
+
+⚠️ 여전히 목표 미작성 학생들:
+{student_list}
+
+🔥 반나절이 지났는데도 {count}명이 계획을 세우지 않았습니다.
+
+👨‍🏫 추가 지도가 필요할 수 있습니다!""",
+    'afternoon_done': """✅ 오후 1시 목표 작성 현황
+
+⏰ 시간: {current_time}
+📅 날짜: {date}
+
+🎉 모든 학생이 목표를 작성완료!
+늦었지만 모두 계획을 세웠네요! 👍""",
+    'late_missing': """🌙 새벽 2시 회고 미작성 알림
+
+⏰ 시간: {current_time}
+📅 대상일: {date}
+
+💭 회고 미작성 학생들:
+{student_list}
+
+📚 {count}명이 어제 하루 마무리를 하지 않았습니다.
+
+👨‍🏫 학습 습관 점검이 필요할 수 있습니다.""",
+    'late_done': """✅ 새벽 2시 회고 작성 현황
+
+⏰ 시간: {current_time}
+📅 대상일: {date}
+
+🎉 모든 학생이 어제 회고를 작성완료!
+좋은 학습 습관이 자리잡고 있네요! 📝""",
+}
+
+def render_notification(template_name, current_time, date, student_names=None):
+    """캐시된 템플릿으로 알림 메시지 생성"""
+    student_names = student_names or []
+    return NOTIFICATION_TEMPLATES[template_name].format(
+        current_time=current_time,
+        date=date,
+        student_list=chr(10).join([f"• {name} 학생" for name in student_names]),
+        count=len(student_names)
+    )
+
+def get_teacher_kakao_tokens():
+    """선생님 토큰 목록 반환 (TEACHER_KAKAO_TOKEN에 쉼표로 여러 개 지정 가능)"""
+    raw = os.environ.get('TEACHER_KAKAO_TOKEN', '')
+    return [token.strip() for token in raw.split(',') if token.strip()]
+
+def send_kakao_memo(token, message):
+    """토큰 하나에 카카오톡 메시지 전송"""
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/x-www-form-urlencoded"
@@ -350,30 +516,62 @@ def send_teacher_kakao_notification(message):
     }
     
     try:
-        app.logger.info(f"📱 카카오톡 메시지 전송 시도...")
-        response = requests.post(url, headers=headers, data=data)
-        
-        app.logger.info(f"📱 응답 상태코드: {response.status_code}")
-        app.logger.info(f"📱 응답 내용: {response.text}")
+        response = requests.post(KAKAO_MEMO_URL, headers=headers, data=data, timeout=KAKAO_TIMEOUT)
         
         if response.status_code == 200:
-            app.logger.info("✅ 선생님 카카오톡 알림 전송 성공")
             return True
         else:
-            app.logger.error(f"❌ 카카오톡 전송 실패: {response.status_code} - {response.text}")
+            app.logger.error(f"❌ 카카오톡 전송 실패 (토큰 {token[:10]}...): {response.status_code} - {response.text}")
             
             # 토큰 만료 확인
             if response.status_code == 401:
-                app.logger.error("🔑 토큰이 만료되었거나 유효하지 않습니다. 새로운 토큰을 발급받아 주세요.")
+                app.logger.error(f"🔑 토큰 {token[:10]}...이 만료되었거나 유효하지 않습니다. 새로운 토큰을 발급받아 주세요.")
             
             return False
             
     except requests.exceptions.RequestException as e:
-        app.logger.error(f"❌ 네트워크 오류: {e}")
+        app.logger.error(f"❌ 네트워크 오류 (토큰 {token[:10]}...): {e}")
         return False
     except Exception as e:
-        app.logger.error(f"❌ 예상치 못한 오류: {e}")
+        app.logger.error(f"❌ 예상치 못한 오류 (토큰 {token[:10]}...): {e}")
+        return False
+
+def send_kakao_batch(messages):
+    """(토큰, 메시지) 목록을 동시에 전송하고 수신자별 결과 반환
+    
+    동시 요청 수는 KAKAO_MAX_CONCURRENCY로 제한됩니다.
+    반환값: [(토큰, 성공여부), ...] - 입력 순서 유지
+    """
+    if not messages:
+        return []
+    
+    started = time.perf_counter()
+    workers = max(1, min(KAKAO_MAX_CONCURRENCY, len(messages)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        sent = list(executor.map(lambda item: send_kakao_memo(*item), messages))
+    elapsed = time.perf_counter() - started
+    
+    results = [(token, ok) for (token, _), ok in zip(messages, sent)]
+    success_count = sum(1 for _, ok in results if ok)
+    app.logger.info(
+        f"📱 카카오톡 일괄 전송 완료: {success_count}/{len(results)}명 성공, "
+        f"동시 {workers}개, 소요 {elapsed:.2f}초"
+    )
+    return results
+
+# 선생님 카카오톡 알림 함수
+def send_teacher_kakao_notification(message):
+    """모든 선생님에게 카카오톡 메시지 전송 - 한 명 이상 성공하면 True"""
+    
+    # 토큰 확인
+    tokens = get_teacher_kakao_tokens()
+    if not tokens:
+        app.logger.error("❌ TEACHER_KAKAO_TOKEN이 설정되지 않았습니다")
         return False
+    
+    app.logger.info(f"📱 카카오톡 메시지 전송 시도... (수신자 {len(tokens)}명)")
+    results = send_kakao_batch([(token, message) for token in tokens])
+    return any(ok for _, ok in results)
 
 def check_morning_goals():
     """오전 11시 - 목표 미작성 학생들 체크"""
@@ -381,7 +579,7 @@ def check_morning_goals():
     current_time = get_korean_time_str()
     
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor()
         
         # 목표와 체크리스트가 모두 비어있는 학생들
@@ -407,29 +605,13 @@ def check_morning_goals():
         if students_without_goals:
             student_names = [student[0] for student in students_without_goals]
             
-            message = f"""📋 오전 11시 목표 미작성 알림
-
-⏰ 시간: {current_time}
-📅 날짜: {get_korean_time_str('%m월 %d일')}
-
-❌ 목표 미작성 학생들:
-{chr(10).join([f"• {name} 학생" for name in student_names])}
-
-총 {len(student_names)}명이 아직 오늘의 목표를 작성하지 않았습니다.
-
-👨‍🏫 확인해보세요!"""
+            message = render_notification('morning_missing', current_time, get_korean_time_str('%m월 %d일'), student_names)
             
             send_teacher_kakao_notification(message)
             app.logger.info(f"오전 11시 알림 완료 - 미작성: {len(student_names)}명")
         else:
             # 모든 학생이 작성했을 때
-            message = f"""✅ 오전 11시 목표 작성 현황
-
-⏰ 시간: {current_time}
-📅 날짜: {get_korean_time_str('%m월 %d일')}
-
-🎉 모든 학생이 목표를 작성했습니다!
-훌륭해요! 👏"""
+            message = render_notification('morning_done', current_time, get_korean_time_str('%m월 %d일'))
             
             send_teacher_kakao_notification(message)
             app.logger.info("오전 11시 - 모든 학생 목표 작성 완료")
@@ -444,7 +626,7 @@ def check_afternoon_goals():
     current_time = datetime.now().strftime('%H시 %M분')
     
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -469,28 +651,12 @@ def check_afternoon_goals():
         if students_still_without_goals:
             student_names = [student[0] for student in students_still_without_goals]
             
-            message = f"""🚨 오후 1시 목표 미작성 재알림
-
-⏰ 시간: {current_time}
-📅 날짜: {datetime.now().strftime('%m월 %d일')}
-
-⚠️ 여전히 목표 미작성 학생들:
-{chr(10).join([f"• {name} 학생" for name in student_names])}
-
-🔥 반나절이 지났는데도 {len(student_names)}명이 계획을 세우지 않았습니다.
-
-👨‍🏫 추가 지도가 필요할 수 있습니다!"""
+            message = render_notification('afternoon_missing', current_time, datetime.now().strftime('%m월 %d일'), student_names)
             
             send_teacher_kakao_notification(message)
             app.logger.info(f"오후 1시 재알림 완료 - 여전히 미작성: {len(student_names)}명")
         else:
-            message = f"""✅ 오후 1시 목표 작성 현황
-
-⏰ 시간: {current_time}
-📅 날짜: {datetime.now().strftime('%m월 %d일')}
-
-🎉 모든 학생이 목표를 작성완료!
-늦었지만 모두 계획을 세웠네요! 👍"""
+            message = render_notification('afternoon_done', current_time, datetime.now().strftime('%m월 %d일'))
             
             send_teacher_kakao_notification(message)
             app.logger.info("오후 1시 - 모든 학생 목표 작성 완료")
@@ -506,7 +672,7 @@ def check_late_completion():
     current_time = datetime.now().strftime('%H시 %M분')
     
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -529,28 +695,12 @@ def check_late_completion():
         if students_incomplete_reflection:
             student_names = [student[0] for student in students_incomplete_reflection]
             
-            message = f"""🌙 새벽 2시 회고 미작성 알림
-
-⏰ 시간: {current_time}
-📅 대상일: {yesterday_display}
-
-💭 회고 미작성 학생들:
-{chr(10).join([f"• {name} 학생" for name in student_names])}
-
-📚 {len(student_names)}명이 어제 하루 마무리를 하지 않았습니다.
-
-👨‍🏫 학습 습관 점검이 필요할 수 있습니다."""
+            message = render_notification('late_missing', current_time, yesterday_display, student_names)
             
             send_teacher_kakao_notification(message)
             app.logger.info(f"새벽 2시 알림 완료 - 회고 미작성: {len(student_names)}명")
         else:
-            message = f"""✅ 새벽 2시 회고 작성 현황
-
-⏰ 시간: {current_time}
-📅 대상일: {yesterday_display}
-
-🎉 모든 학생이 어제 회고를 작성완료!
-좋은 학습 습관이 자리잡고 있네요! 📝"""
+            message = render_notification('late_done', current_time, yesterday_display)
             
             send_teacher_kakao_notification(message)
             app.logger.info("새벽 2시 - 모든 학생 회고 작성 완료")
@@ -597,8 +747,15 @@ def test_kakao():
 시간: {get_korean_time_str()}
 날짜: {get_korean_time_str('%Y년 %m월 %d일')}"""
     
-    result = send_teacher_kakao_notification(test_message)
-    return f"테스트 메시지 {'✅ 성공' if result else '❌ 실패'}"
+    tokens = get_teacher_kakao_tokens()
+    if not tokens:
+        return "❌ TEACHER_KAKAO_TOKEN이 설정되지 않았습니다"
+    
+    results = send_kakao_batch([(token, test_message) for token in tokens])
+    return "<br>".join(
+        f"🔑 {token[:10]}...: 테스트 메시지 {'✅ 성공' if ok else '❌ 실패'}"
+        for token, ok in results
+    )
 
 @app.route('/check_kakao_token')
 def check_kakao_token():
@@ -606,30 +763,58 @@ def check_kakao_token():
     if 'user_id' not in session or session['role'] != 'teacher':
         return "권한이 없습니다", 403
     
-    token = os.environ.get('TEACHER_KAKAO_TOKEN')
+    tokens = get_teacher_kakao_tokens()
     
-    if not token:
+    if not tokens:
         return "❌ TEACHER_KAKAO_TOKEN이 설정되지 않았습니다"
     
     # 토큰 유효성 검사
-    try:
-        import requests
-        response = requests.get(
-            "https://kapi.kakao.com/v1/user/access_token_info",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            return f"""✅ 토큰 상태: 유효<br>
+    statuses = []
+    for token in tokens:
+        try:
+            response = requests.get(
+                "https://kapi.kakao.com/v1/user/access_token_info",
+                headers={"Authorization": f"Bearer {token}"},
+                timeout=KAKAO_TIMEOUT
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                statuses.append(f"""✅ 토큰 상태: 유효<br>
 📱 앱 ID: {data.get('app_id')}<br>
 ⏰ 만료까지: {data.get('expires_in')}초<br>
-🔑 토큰 앞 10자리: {token[:10]}..."""
-        else:
-            return f"❌ 토큰 상태: 무효 ({response.status_code})<br>응답: {response.text}"
-            
-    except Exception as e:
-        return f"❌ 토큰 확인 오류: {str(e)}"
+🔑 토큰 앞 10자리: {token[:10]}...""")
+            else:
+                statuses.append(f"❌ 토큰 상태: 무효 ({response.status_code})<br>🔑 토큰 앞 10자리: {token[:10]}...<br>응답: {response.text}")
+                
+        except Exception as e:
+            statuses.append(f"❌ 토큰 확인 오류 ({token[:10]}...): {str(e)}")
+    
+    return "<br><br>".join(statuses)
+
+@app.route('/check_db_routing')
+def check_db_routing():
+    """읽기 복제본 라우팅 상태 확인"""
+    if 'user_id' not in session or session['role'] != 'teacher':
+        return "권한이 없습니다", 403
+    
+    if not os.environ.get('DATABASE_REPLICA_URL'):
+        return "ℹ️ DATABASE_REPLICA_URL이 설정되지 않았습니다 - 모든 쿼리가 primary로 갑니다"
+    
+    conn = _connect_replica()
+    if conn:
+        conn.close()
+    
+    with _replica_lock:
+        state = dict(_replica_state)
+        sticky_count = len(_recent_writes)
+    
+    lag = f"{state['lag']:.1f}초" if state['lag'] is not None else "확인 전"
+    return f"""{'✅' if state['healthy'] else '⚠️'} 복제본 상태: {'정상' if state['healthy'] else '사용 중지'}<br>
+⏱️ 복제 지연: {lag} (허용 {REPLICA_MAX_LAG_SECONDS}초)<br>
+🧭 현재 읽기 연결: {'복제본' if conn else 'primary'}<br>
+📌 primary 고정 중인 학생: {sticky_count}명<br>
+❗ 최근 오류: {state['error'] or '없음'}"""
 
 @app.route('/test_morning')
 def test_morning():